@@ -4,43 +4,125 @@ Real Estate Analysis App
 This script:
 - Connects to Google Sheets using gspread
 - Creates or opens a worksheet named with today's date
-- Uses Selenium WebDriver to open a real estate website
+- Downloads real estate listing pages with requests
 - Prepares data for storage in Google Sheets
 
-Selenium is used to automate the browser and collect
+lxml is used to parse the listing pages and collect
 real estate data such as prices, locations, and links.
 """
 
+import os
+import re
+import time
 import gspread
-from google.oauth2.service_account import Credentials
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
 
 """
-Selenium waiting tools.
+HTTP and HTML parsing tools.
 
-Used to wait for webpage elements to load before scraping.
-Improves scraper reliability.
+Krisha.kz serves the listing cards as static HTML, so the pages
+are downloaded with requests and parsed with lxml.
+No browser is needed for normal pages.
 """
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import requests
+import lxml.html
+from lxml import etree
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 
+# requests downloads the listing pages over one keep-alive session.
+# lxml parses the HTML in-process, so reading a card field is a local
+# XPath lookup instead of a round-trip to a browser.
 
-# Selenium is a powerful tool for web scraping and browser automation. 
-# In this project, Selenium is used to navigate to the real estate listing website.
+"""
+Selenium WebDriver is only a fallback.
+
+Chrome is started only if a page cannot be read over plain HTTP.
+It is optional: without selenium, or if Chrome cannot be started,
+such pages are treated as having no cards.
+"""
+try:
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+except ImportError:
+    webdriver = None
 
 import pandas as pd
 import numpy as np
 
 # Pandas helps me organize and analyze my scraped data easier. 
-# In my project, pandas turns raw Selenium data into a clean table.
+# In my project, pandas turns raw scraped data into a clean table.
+
+"""
+Numba compiles the numeric scoring kernel to machine code.
+
+It is optional: without it the kernel runs as plain Python.
+"""
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 from gspread_formatting import *
 # gspread-formatting is a library that allows you to apply formatting to Google Sheets using gspread.
 
 
+# ==============================
+# PATTERNS AND URLS
+# ==============================
+"""
+Regular expressions and URL templates used by the scraper and the analysis.
+
+They are compiled and defined once here, at import time,
+and reused everywhere below.
+"""
+LISTING_URL = "https://krisha.kz/prodazha/kvartiry/{city}/?page={page}"
+ROOMS_LISTING_URL = "https://krisha.kz/prodazha/kvartiry/{city}/?das[live.rooms]={rooms}&page={page}"
+# Krisha.kz listing pages, with and without the rooms filter.
+
+# Rooms and apartment size, read together from the card text.
+ROOMS_SQM_RE = re.compile(
+    r"(?:(?P<rooms>\d+)\s*[- ]?\s*ком.*?)?(?P<sqm>\d+\.?\d*)\s?[mм]²"
+)
+
+# (?: ... )? - Optional rooms part before the size
+# (?P<rooms>\d+) - One or more digits (1, 2, 10, etc.) saved as 'rooms'
+# \s*[- ]?\s* - Optional whitespace and separator (space or dash)
+# ком - The word "ком" (short for "комната" meaning "room")
+# .*? - Anything up to the size, as little as possible
+# (?P<sqm>\d+\.?\d*) - Size with optional decimals (e.g., 45, 60.5) saved as 'sqm'
+# \s?[mм]² - Optional whitespace, Latin m or Russian м, square meters symbol
+
+# Price cleaning: everything that is not a digit.
+NONDIGIT_RE = re.compile(r"\D+")
+
+# \D - any character that is NOT a digit (0-9)
+# + - one or more in a row, so each run of spaces, currency
+#     symbols or text is removed in a single substitution
+
+# Keywords representing central districts.
+center_keywords = [
+"Самал",
+"Достык",
+"Абая",
+"Коктем",
+"Орбита",
+"Медеу"
+]
+
+CENTER_RE = re.compile(
+"|".join(map(re.escape, center_keywords)),
+re.IGNORECASE
+)
+# One case-insensitive pattern matching any of the center keywords,
+# so each location is scanned once instead of once per keyword.
+
+
 # ==============================
 # USER INPUT
 # ==============================
@@ -78,7 +160,7 @@ city_slug = "almaty"
 # Budget conversion 
 try:
     max_price = int(price_input)
-except:
+except ValueError:
     max_price = 500000000
 
 SCOPE = [
@@ -87,109 +169,401 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive"
     ]
 
-CREDS = Credentials.from_service_account_file('creds3.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPREAD_CLIENT.open('real_estate_analysis_app')
+GSPREAD_CLIENT = gspread.service_account(
+    filename='creds3.json',
+    scopes=SCOPE
+)
+# Loads the service account credentials and authorizes the client in one step.
+
+SHEET_NAME = 'real_estate_analysis_app'
+
+SHEET_KEY = os.environ.get("SHEET_KEY")
+# Optional spreadsheet ID, the part of the sheet URL after /spreadsheets/d/.
+# Opening by key is a direct lookup; opening by name searches Google Drive first.
 
 today = datetime.now().strftime("%Y-%m-%d")
 
-# Creates or opens a worksheet in Google Sheets named with today's date.
 
-try:
-    TODAY_WS = SHEET.worksheet(today)
-except:
-    TODAY_WS = SHEET.add_worksheet(
-        title=today,
-        rows="10000",
-        cols="20"
-    )
+def open_today_worksheet():
+    """
+    Creates or opens a worksheet in Google Sheets named with today's date.
+
+    Opens the spreadsheet, lists its worksheets with a single API call
+    and adds today's worksheet if it does not exist yet.
+    """
+    if SHEET_KEY:
+        sheet = GSPREAD_CLIENT.open_by_key(SHEET_KEY)
+    else:
+        sheet = GSPREAD_CLIENT.open(SHEET_NAME)
+
+    worksheets = {ws.title: ws for ws in sheet.worksheets()}
+
+    if today not in worksheets:
+        worksheets[today] = sheet.add_worksheet(
+            title=today,
+            rows=10000,
+            cols=20
+        )
 
-driver = webdriver.Chrome()
+    return worksheets[today]
+
+
+"""
+Open today's worksheet in the background.
+
+The Google Sheets calls and the listing downloads hit different servers,
+so the worksheet is opened on its own thread while the pages download.
+The result is only needed right before the upload.
+"""
+SHEETS_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+TODAY_WS_FUTURE = SHEETS_EXECUTOR.submit(open_today_worksheet)
 
 MAX_PAGES=10
 # max_pages is set to 10 to limit the number of pages scraped for testing purposes.
 
-all_data=[]
+MAX_WORKERS=8
+# Number of listing pages downloaded at the same time.
+
+FETCH_ATTEMPTS=2
+# A page is downloaded again once if the first attempt fails.
+
+RETRY_DELAY=2
+# Seconds to wait before downloading a page again, so a throttled
+# request is not repeated straight away.
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/124.0 Safari/537.36"
+)
+# A realistic browser User-Agent so the site serves the normal listing page.
 
-page=1
+sess = requests.Session()
+sess.headers.update({
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml"
+})
+# One session keeps the connection to krisha.kz open between pages.
+# Pages are requested as HTML; requests' default Accept-Encoding
+# already asks for compressed responses.
 
-while page<=MAX_PAGES:
+HTML_ENCODING = "utf-8"
+# Krisha.kz pages are UTF-8; decode them as such so Cyrillic text is read correctly.
+
+"""
+Compiled XPath expressions for the listing cards.
+
+Each expression is compiled once here and then evaluated on every
+card, instead of parsing the XPath string again for every lookup.
+"""
+CARDS_XPATH = etree.XPath('//div[contains(concat(" ", normalize-space(@class), " "), " a-card ")]')
+HEADER_XPATH = etree.XPath('.//*[contains(@class,"a-card__header")]')
+PRICE_XPATH = etree.XPath('.//*[contains(@class,"a-card__price")]')
+LOCATION_XPATH = etree.XPath('.//*[contains(@class,"a-card__subtitle")]')
+LINK_XPATH = etree.XPath('.//a/@href')
+
+
+def parse_html(content):
     """
-    Iterate through Krisha.kz apartment listing pages and collect card data.
+    Parse HTML bytes into an lxml tree.
 
-    For each page:
-        - Open the page using Selenium
-        - Find all elements with class 'a-card'
-        - Extract header, price, location, link, and full card text
-        - Store extracted data in all_data list
+    A new parser is built for every call because lxml lets only one
+    thread at a time use a parser object, and pages are parsed on
+    the download threads.
 
-    The loop continues until MAX_PAGES is reached.
+    Raises lxml.etree.ParserError if content is empty.
+    """
+    parser = lxml.html.HTMLParser(encoding=HTML_ENCODING)
 
-    Notes
-    -----
-    Cards missing required elements are skipped.
+    return lxml.html.fromstring(content, parser=parser)
+
+
+def element_text(element):
+    """
+    Return the whitespace-normalized text of an element.
+
+    Text pieces are joined with a space, so text from neighbouring
+    blocks (e.g. "12" and "45 м²") never runs together like
+    text_content() would make it ("1245 м²").
     """
+    return " ".join(" ".join(element.itertext()).split())
 
+
+def card_text(card, xpath):
+    """
+    Return the whitespace-normalized text of the first element
+    matching the compiled xpath inside card.
+
+    Raises IndexError if the card has no such element.
+    """
+    return element_text(xpath(card)[0])
+
+
+def url_for(page):
+    """
+    Build the Krisha.kz listing URL for the given page number,
+    including the rooms filter when the user entered one.
+    """
     if rooms_input:
 
-        url = f"https://krisha.kz/prodazha/kvartiry/{city_slug}/?das[live.rooms]={rooms_input}&page={page}"
+        return ROOMS_LISTING_URL.format(city=city_slug, rooms=rooms_input, page=page)
 
-    else:
-        url = f"https://krisha.kz/prodazha/kvartiry/{city_slug}/?page={page}"
+    return LISTING_URL.format(city=city_slug, page=page)
 
-    driver.get(url)
 
-    print("Page",page)
+def fetch_page(page):
+    """
+    Download and parse one listing page, retrying on network errors
+    and on throttling (429) or server error (5xx) responses.
+
+    Returns the final page URL (after redirects), the HTTP status code
+    and the parsed lxml tree, or (None, None, None) if every attempt failed.
+    The tree is None if the page body was empty.
+    """
+    for attempt in range(1, FETCH_ATTEMPTS+1):
+
+        try:
+
+            resp = sess.get(url_for(page), timeout=10)
+
+            if (resp.status_code == 429 or resp.status_code >= 500) and attempt < FETCH_ATTEMPTS:
+
+                print(f"Page {page}: download attempt {attempt} got HTTP {resp.status_code}")
+                time.sleep(RETRY_DELAY)
+                continue
+            # Throttling and server errors are usually transient; the last
+            # attempt's response is returned as it is.
+
+            tree = parse_html(resp.content)
+            # Parsing here, on the download thread, overlaps it with the
+            # other downloads: lxml releases the GIL while parsing.
+
+            return resp.url, resp.status_code, tree
+
+        except etree.ParserError:
+
+            return resp.url, resp.status_code, None
+        # An empty body ("Document is empty") is a page without cards.
+
+        except requests.RequestException as e:
+
+            print(f"Page {page}: download attempt {attempt} failed:",e)
+
+            if attempt < FETCH_ATTEMPTS:
+                time.sleep(RETRY_DELAY)
+
+    return None, None, None
+
+
+driver = None
+# Chrome WebDriver, started by render_page() the first time it is needed.
+
+
+def start_chrome():
+    """
+    Start headless Chrome for the fallback.
+
+    Raises WebDriverException if Chrome or chromedriver is not available.
+    """
+    opts = webdriver.ChromeOptions()
+    opts.add_argument("--headless=new")
+    opts.add_argument("--disable-gpu")
+    opts.add_argument("--no-sandbox")
+    opts.add_argument("--disable-dev-shm-usage")
+    opts.add_argument("--blink-settings=imagesEnabled=false")
+    opts.add_experimental_option("prefs", {
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.fonts": 2
+    })
+    # Headless Chrome without images, stylesheets and fonts:
+    # only the page text is read, so nothing else is downloaded or drawn.
+
+    return webdriver.Chrome(options=opts)
+
+
+def render_page(page):
+    """
+    Open one listing page in Chrome and parse its rendered HTML.
+
+    Used only when plain HTTP was refused or the first page had no cards.
+    Returns the page URL and the parsed lxml tree,
+    or (None, None) if Chrome could not open the page.
+    """
+    global driver
 
     try:
 
-        WebDriverWait(driver,10).until(
-            EC.presence_of_all_elements_located(
-                (By.CLASS_NAME,"a-card")
+        if driver is None:
+            driver = start_chrome()
+
+        driver.get(url_for(page))
+
+        try:
+
+            WebDriverWait(driver,10).until(
+                EC.presence_of_element_located(
+                    (By.CLASS_NAME,"a-card")
+                )
             )
-        )
 
-    except:
+        except TimeoutException:
+            pass
+        # Waits only until the first card is present instead of a fixed sleep.
+        # If no card appears in 10 seconds, the page has no listings.
 
-        print("No more pages.")
+        return driver.current_url, parse_html(driver.page_source.encode(HTML_ENCODING))
+
+    except WebDriverException as e:
+
+        print("Chrome could not open the page:",e)
+        return None, None
+    # No Chrome or chromedriver installed (e.g. on Heroku) or a browser error.
+
+
+SCRAPE_CACHE = os.environ.get("SCRAPE_CACHE") == "1"
+# Optional: set SCRAPE_CACHE=1 to reuse today's scrape when re-running
+# the analysis. By default every run scrapes the site live.
+
+CACHE_PATH = os.path.join(
+    "cache",
+    f"{today}_{city_slug}_rooms-{rooms_input or 'any'}.csv"
+)
+# Today's scraped listings for this search, saved on disk after scraping
+# when SCRAPE_CACHE is set. Re-running with it on the same day loads this
+# file instead of downloading every page again.
+
+USE_CACHE = SCRAPE_CACHE and os.path.exists(CACHE_PATH)
+
+"""
+Download all listing pages concurrently.
+
+Downloading is network-bound and releases the GIL, so a thread pool
+fetches and parses every page at the same time over the shared session.
+Total wait is roughly one page instead of MAX_PAGES pages.
+Nothing is downloaded when today's listings are already cached.
+"""
+if USE_CACHE:
+
+    print("Loading today's listings from",CACHE_PATH)
+    pages = []
+
+else:
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        pages = list(executor.map(fetch_page, range(1, MAX_PAGES+1)))
+
+all_data={
+"header":[],
+"price":[],
+"location":[],
+"link":[],
+"combined_text":[]
+}
+# Scraped data is stored column by column: one list per field.
+
+seen_links=set()
+# Links of listings already collected. The same listing can appear on
+# several pages (e.g. promoted cards), so each property is kept only once.
+
+use_chrome = False
+# Set once a page had to be opened in Chrome; every later page is then
+# opened in Chrome too, since plain HTTP will not show its cards either.
+
+for page, (page_url, status, tree) in enumerate(pages, start=1):
+    """
+    Iterate through the downloaded Krisha.kz listing pages and collect card data.
+
+    For each page:
+        - Take the page parsed by lxml on its download thread
+        - Find all elements with class 'a-card'
+        - Re-open the page in Chrome if HTTP was refused or page 1 had no cards,
+          and keep using Chrome for the remaining pages
+        - Extract header, price, location, link, and full card text
+        - Skip listings whose link was already collected
+        - Store extracted data in the all_data column lists
+
+    The loop stops at the first page without cards.
+
+    Notes
+    -----
+    Cards missing required elements are skipped.
+    """
+
+    print("Page",page)
+
+    if page_url is None and not use_chrome:
+
+        print("Page could not be downloaded.")
         break
 
 # The website krisha.kz is a popular real estate listing site in Kazakhstan, 
-# where users can find apartments for sale in Almaty. The script opens this
-# website using Selenium WebDriver to prepare for data extraction. This website doesn't
+# where users can find apartments for sale in Almaty. The script downloads
+# its listing pages to prepare for data extraction. This website doesn't
 # have blockers and is accessible for scraping, making it a suitable choice for 
 # collecting real estate data.
 
 
-    cards = driver.find_elements(By.CLASS_NAME,"a-card")
- 
+    cards = CARDS_XPATH(tree) if tree is not None else []
+
+    if use_chrome:
+
+        page_url, tree = render_page(page)
+        cards = CARDS_XPATH(tree) if tree is not None else []
+
+    elif (status != 200 or (page == 1 and not cards)) and webdriver is not None:
+
+        print("Page not readable over HTTP, opening it in Chrome.")
+
+        use_chrome = True
+        page_url, tree = render_page(page)
+        cards = CARDS_XPATH(tree) if tree is not None else []
+    # Fall back to a real browser if the site refused the plain HTTP
+    # request, or if even the first page had no cards (a block page or
+    # cards rendered by JavaScript). An empty later page is simply the
+    # end of the results and does not start Chrome; once Chrome is in use,
+    # the first page it renders without cards ends the loop.
+
+    if not cards:
+
+        print("No more pages.")
+        break
+
     for card in cards:
         
         try:
 
-            header=card.find_element(By.CLASS_NAME,"a-card__header").text
-            price=card.find_element(By.CLASS_NAME,"a-card__price").text
-            location=card.find_element(By.CLASS_NAME,"a-card__subtitle").text
-            link=card.find_element(By.TAG_NAME,"a").get_attribute("href")
+            link=urljoin(page_url, LINK_XPATH(card)[0])
+            # Card links are relative in the HTML; make them full URLs like the browser did.
+            # Only the card link is resolved, instead of rewriting every link on the page.
+
+            if link in seen_links:
+                continue
+
+            header=card_text(card,HEADER_XPATH)
+            price=card_text(card,PRICE_XPATH)
+            location=card_text(card,LOCATION_XPATH)
 
-            combined_text=card.text
+            combined_text=element_text(card)
 
-            all_data.append([
-            header,
-            price,
-            location,
-            link,
-            combined_text
-            ])
+            all_data["header"].append(header)
+            all_data["price"].append(price)
+            all_data["location"].append(location)
+            all_data["link"].append(link)
+            all_data["combined_text"].append(combined_text)
 
-        except Exception as e:
+            seen_links.add(link)
 
-            print("Skipping a card due to missing data:",e)
+        except IndexError:
+
+            print("Skipping a card due to missing data.")
             continue
-    page+=1
 
-driver.quit()
+sess.close()
+#Close the HTTP session properly after scraping to free up connections.
+
+if driver is not None:
+    driver.quit()
 #Close browser properly after scraping to free up system resources.
 
 
@@ -202,43 +576,85 @@ Each row represents one flat listing with:
 - location
 - link
 - combined_text
+
+Cached listings are read back as plain text, exactly as scraped.
 """
-df = pd.DataFrame(
-all_data,
-columns=[
-"header",
-"price",
-"location",
-"link",
-"combined_text"
-]
-)
+if USE_CACHE:
 
-# Check if DataFrame is empty after scraping. If no listings were found, print a message and exit.
-if df.empty:
+    df = pd.read_csv(
+        CACHE_PATH,
+        dtype=str,
+        keep_default_na=False
+    )
 
-    print("No listings found.")
-    exit()
+else:
 
-"""
-The code belowe: extract the number of rooms from the flat header and convert it to numeric format.
-""" 
-df["rooms"] = df["header"].str.extract(
-    r"(\d+)\s*[- ]?\s*ком"
-)
+    df = pd.DataFrame(all_data)
+    # Columns are already separate lists, so pandas builds each column
+    # directly without transposing a list of rows.
 
-# () - Extract this part
-# \d+ - One or more digits (1, 2, 10, etc.)
-# \s* - Optional whitespace
-# [- ]? - Optional separator (space or dash)
-# ком - The word "ком" (short for "комната" meaning "room")
+    if SCRAPE_CACHE and not df.empty:
+        os.makedirs("cache", exist_ok=True)
+        df.to_csv(CACHE_PATH, index=False)
+    # Only a scrape that found listings is cached, and only when asked for.
+
+del all_data
+# The DataFrame now owns the data; free the scraped lists.
+
+df["location"] = df["location"].astype("category")
+# Many listings share the same district, so location is stored as a category.
+# String methods on a category column (.str.contains for the location
+# filter and the center score) run once per unique district and are then
+# mapped back to every row, instead of running once per listing.
+
+def exit_if_empty(df, message="No listings match filters."):
+    """
+    Print a message and exit when no listings are left.
+
+    Called after scraping and after every filter, so the
+    statistics, scoring and Sheets upload never run on an
+    empty DataFrame.
+    """
+    if df.empty:
+
+        print(message)
+        exit()
+
+
+# Check if DataFrame is empty after scraping. If no listings were found, print a message and exit.
+exit_if_empty(df, "No listings found.")
+
+"""
+Extract the number of rooms and the apartment size from the card text
+and convert both to numeric format.
+
+One compiled pattern captures both values in a single scan of
+'combined_text', which starts with the flat header
+(e.g. "2-комнатная квартира · 45 м² · 5/9 этаж").
+Listings without a size are dropped later, so rooms are only
+needed where the size is found.
+"""
+df[["rooms","sqm"]] = df["combined_text"].str.extract(ROOMS_SQM_RE)
 
 df["rooms"] = pd.to_numeric(
     df["rooms"],
-    errors="coerce"
+    errors="coerce",
+    downcast="float"
 )
 
+df["sqm"] = pd.to_numeric(
+    df["sqm"],
+    errors="coerce"
+).astype(np.float32)
+
 # errors="coerce" converts non-numeric values to NaN, which is useful for filtering later.
+# float32 uses half the memory of the default float64, so every later
+# filter reads less data. downcast="float" only narrows when the values fit,
+# so an oversized room count from free text can never raise.
+
+df = df.drop(columns=["combined_text"])
+# The full card text is only needed for the rooms and size extraction.
+# Dropping it keeps filtering, sorting and fillna from carrying it along.
 
 if rooms_input:
 
@@ -246,13 +662,7 @@ if rooms_input:
         df["rooms"] == int(rooms_input)
     ]
 
-
-
-"""
-Remove duplicate flat listings based on the link column.
-Ensures each property appears only once in the dataset.
-"""
-df = df.drop_duplicates(subset=["link"])
+    exit_if_empty(df)
 
 
 
@@ -269,12 +679,19 @@ missing values.
 if location_input:
 
     df = df[
-        df["location"].str.lower().str.contains(
-        location_input.lower(),
+        df["location"].str.contains(
+        re.escape(location_input),
+        case=False,
+        regex=True,
         na=False
         )
     ]
 
+    exit_if_empty(df)
+# case=False matches case-insensitively without building a lowercased copy
+# of every location first. re.escape keeps characters like "." or "("
+# in the user's text literal.
+
 """
 Clean and convert price data.
 
@@ -285,21 +702,13 @@ This code:
 3. Converts the cleaned prices into numeric format.
 4. Invalid or missing values are converted to NaN.
 """
-df["price_clean"] = df["price"].str.replace(
-r"[^\d]",
-"",
-
-# [] - Matches any character in the set
-# ^ inside brackets = NOT
-# \d = any digit (0-9)
-# [^\d] - Matches any character that is NOT a digit (0-9)
-regex=True
-)
-
 df["price_clean"] = pd.to_numeric(
-df["price_clean"],
-errors="coerce"
+df["price"].str.replace(NONDIGIT_RE, "", regex=True),
+errors="coerce",
+downcast="integer"
 )
+# downcast="integer" stores prices as the smallest integer type that fits
+# (int32 for prices up to about 2 billion ₸) when no price is missing.
 
 
 df = df[
@@ -307,34 +716,7 @@ df["price_clean"] <= max_price
 ]
 # Filter out listings that exceed the user's maximum budget to focus on relevant properties.
 
-"""
-Extract and convert apartment size in square meters.
-
-This code:
-1. Searches the 'combined_text' column for apartment sizes
-   like "45 m²" or "60м²".
-2. Extracts the numeric size value using a regular expression.
-3. Stores the result in a new column called 'sqm'.
-4. Converts the extracted values into numeric format.
-5. Invalid or missing values are converted to NaN.
-"""
-df["sqm"] = df["combined_text"].str.extract(
-r"(\d+\.?\d*)\s?[mм]²"
-)
-
-# \d+ - One or more digits (e.g., 45, 60)
-# \.? - optional decimal point (for sizes like 45.5)
-# \d* - optional decimals
-# \s? - optional whitespace
-# [mм]- Latin m or Russian м
-# ² - square meters symbol
-
-df["sqm"] = pd.to_numeric(
-df["sqm"],
-errors="coerce"
-)
-
-
+exit_if_empty(df)
 
 """
 Calculate price per square meter.
@@ -346,9 +728,12 @@ in the 'price_per_m2' column.
 df=df[df["sqm"]>0]
 # Filter out listings with zero or negative size to avoid division errors.
 
+exit_if_empty(df)
+
 df["price_per_m2"] = (
 df["price_clean"]/df["sqm"]
-)
+).astype(np.float32)
+# float32 keeps about 7 significant digits, plenty for price per m².
 
 
 """
@@ -359,6 +744,8 @@ is greater than 100000 to remove incorrect or invalid data.
 """
 df = df[df["price_per_m2"] > 100000]
 
+exit_if_empty(df)
+
 
 
 """
@@ -372,21 +759,20 @@ This code:
    Q1 - 1.5 * IQR to Q3 + 1.5 * IQR.
 4. Keeps only listings within the normal price range.
 """
-Q1 = df["price_per_m2"].quantile(0.25)
-
-# Finds the 25% percentile
-# Lower price range
+ppm2 = df["price_per_m2"].to_numpy()
+# Plain NumPy array of price per m², without pandas index overhead.
+# The checks above guarantee at least one listing here.
 
-Q3 = df["price_per_m2"].quantile(0.75)
+Q1, Q3 = np.quantile(ppm2, [0.25, 0.75])
 
-# Finds the 75% percentile
-# Upper price range
+# Finds the 25% and 75% percentiles in one pass
+# Lower and upper price range
 
 IQR = Q3-Q1
 
 df = df[
-(df["price_per_m2"]>=Q1-1.5*IQR) &
-(df["price_per_m2"]<=Q3+1.5*IQR)
+(ppm2>=Q1-1.5*IQR) &
+(ppm2<=Q3+1.5*IQR)
 ]
 # Remove apartments with extremely low or extremely high price per m².
 # This helps to focus on realistic listings and improve analysis accuracy.
@@ -395,93 +781,113 @@ df = df[
 
 
 
+"""
+Calculate location-based scores.
+
+This section:
+
+CENTER SCORE:
+1. Uses the center_keywords pattern (CENTER_RE)
+   defined with the other patterns at the top of the file.
+2. Checks whether each listing location contains
+   one of the center keywords.
+3. Assigns a center_score:
+   - 1 = central location
+   - 0 = non-central location
+   """
+df["center_score"] = df["location"].str.contains(
+CENTER_RE,
+na=False
+).astype(np.int8)
+
+
 """
 Calculate investment scores based on price per square meter.
 
 This code:
-1. Calculates the mean and standard deviation of price_per_m2.
+1. Calculates the mean, standard deviation and maximum of price_per_m2
+   together in a single pass.
 2. Computes a z-score to measure how each listing compares
    to the average price per square meter.
 3. Creates an undervaluation score where cheaper properties
    receive higher scores.
 4. Creates a liquidity score based on relative price per m²,
    where lower prices result in higher liquidity scores.
+
+INVESTMENT SCORE:
+Combines multiple factors into a single score:
+   - undervaluation_score (cheaper properties score higher)
+   - liquidity_score (more affordable properties score higher)
+   - center_score (central locations score higher)
+
+Higher investment_score indicates a potentially
+better investment opportunity.
 """
-mean = df["price_per_m2"].mean()
-# The mean (average) price per square meter across all listings.
 
-std = df["price_per_m2"].std()
-# Standard deviation = average distance from the mean
 
-if std and not np.isnan(std):
-    df["z_score"]=(df["price_per_m2"]-mean)/std
-# Z-score is a number that shows how far a value is 
-# from the mean (average), measured in standard deviations.
-else:
-    df["z_score"]=0
+@njit(cache=True)
+def score_listings(ppm2, center):
+    """
+    Compute z-score, liquidity score and investment score
+    for every listing in two loops over the price per m² array:
+    one for the statistics, one for the scores.
 
-df["undervaluation_score"]=-df["z_score"]
+    Returns three NumPy arrays with one value per listing.
+    """
+    n = ppm2.size
 
-max_m2=df["price_per_m2"].max()
+    mean = 0.0
+    # The mean (average) price per square meter across all listings.
+    m2 = 0.0
+    # Sum of squared differences from the mean.
+    max_m2 = ppm2[0]
 
-# safe liquidity score calculation that avoids division by zero
-if max_m2 and not np.isnan(max_m2):
-    df["liquidity_score"]=(max_m2-df["price_per_m2"])/max_m2
-else:
-    df["liquidity_score"]=0
-# Liquidity score is higher for cheaper properties, indicating they may sell faster.
+    for i in range(n):
 
+        # Welford's method updates the mean and the sum of squared
+        # differences in the same pass, without a second read of the data.
+        delta = ppm2[i] - mean
+        mean += delta / (i + 1)
+        m2 += delta * (ppm2[i] - mean)
 
-"""
-Calculate location-based and investment scores.
+        if ppm2[i] > max_m2:
+            max_m2 = ppm2[i]
 
-This section:
+    std = np.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+    # Standard deviation = average distance from the mean
+    # n - 1 gives the sample standard deviation, the same as pandas .std().
 
-CENTER SCORE:
-1. Defines keywords representing central districts.
-2. Checks whether each listing location contains
-   one of the center keywords.
-3. Assigns a center_score:
-   - 1 = central location
-   - 0 = non-central location
-   """
-center_keywords = [
-"Самал",
-"Достык",
-"Абая",
-"Коктем",
-"Орбита",
-"Медеу"
-]
+    z_score = np.empty(n, np.float32)
+    liquidity_score = np.empty(n, np.float32)
+    investment_score = np.empty(n, np.float32)
+    # Statistics are accumulated in float64, scores are stored as float32.
 
-df["center_score"] = df["location"].apply(
-lambda x: any(
-k.lower() in x.lower()
-for k in center_keywords
-)
-).astype(int)
+    for i in range(n):
 
+        # Z-score is a number that shows how far a value is
+        # from the mean (average), measured in standard deviations.
+        z_score[i] = (ppm2[i] - mean) / std if std > 0 else 0.0
 
-"""
-INVESTMENT SCORE:
-Combines multiple factors into a single score:
-   - undervaluation_score (cheaper properties score higher)
-   - liquidity_score (more affordable properties score higher)
-   - center_score (central locations score higher)
+        # safe liquidity score calculation that avoids division by zero
+        liquidity_score[i] = (max_m2 - ppm2[i]) / max_m2 if max_m2 > 0 else 0.0
 
-Higher investment_score indicates a potentially
-better investment opportunity.
-"""
-df["investment_score"] = (
+        # Center location is weighted more heavily in the investment score.
+        investment_score[i] = -z_score[i] + liquidity_score[i] + 3 * center[i]
+
+    return z_score, liquidity_score, investment_score
 
-df["undervaluation_score"]
-+
-df["liquidity_score"]
-+
-3*df["center_score"] # Center location is weighted more heavily in the investment score.
 
+z_score, liquidity_score, investment_score = score_listings(
+df["price_per_m2"].to_numpy(),
+df["center_score"].to_numpy()
 )
 
+df["z_score"]=z_score
+df["undervaluation_score"]=-z_score
+df["liquidity_score"]=liquidity_score
+# Liquidity score is higher for cheaper properties, indicating they may sell faster.
+df["investment_score"]=investment_score
+
 df=df.fillna(0)
 # Replace any remaining NaN values with 0 to ensure all listings have valid scores.
 # Replace missing values and show the best investments first.
@@ -496,35 +902,75 @@ ascending=False
 Write analyzed real estate data to today's worksheet.
 
 This code:
-1. Clears the current worksheet to remove old data.
-2. Adds a header row with column names.
-3. Uploads the processed DataFrame rows to Google Sheets.
+1. Builds one table: a header row with column names
+   followed by the processed DataFrame rows.
+2. Resizes the worksheet to exactly the size of the table,
+   which removes old data outside it.
+3. Uploads the whole table to Google Sheets starting at cell A1,
+   in a single update call unless it is very large.
 4. Stores key metrics such as sqm, price per m²,
    z-score, liquidity score, center score,
    and investment score.
 """
-TODAY_WS.clear()
-# Removes old data.
+TODAY_WS = TODAY_WS_FUTURE.result()
+SHEETS_EXECUTOR.shutdown()
+# Waits for the worksheet opened during scraping (usually already done).
+# Any Google Sheets error from that thread is raised here.
 
-TODAY_WS.append_row([
+SHEET_COLUMNS = [
 "header","price","location","link",
 "sqm","price_per_m2",
 "z_score","liquidity_score",
 "center_score","investment_score"
-])
-# Creates table headers.
+]
 
-TODAY_WS.append_rows(
-df[[
-"header","price","location","link",
+FLOAT_COLUMNS = [
 "sqm","price_per_m2",
 "z_score","liquidity_score",
-"center_score","investment_score"
-]].values.tolist()
+"investment_score"
+]
+
+columns = [
+df[col].astype(np.float64).round(3).tolist()
+if col in FLOAT_COLUMNS
+else df[col].tolist()
+for col in SHEET_COLUMNS
+]
+# Each column is converted to plain Python values on its own, so pandas
+# never boxes the mixed columns into one object array.
+# float32 values are widened and rounded so Sheets gets 45.3 instead
+# of the float32 rounding noise 45.29999923706055.
+
+payload = [SHEET_COLUMNS] + [list(row) for row in zip(*columns)]
+# Table headers followed by the data rows, in a format Google Sheets understands.
+
+TODAY_WS.resize(
+rows=len(payload),
+cols=len(SHEET_COLUMNS)
 )
+# Fits the sheet grid to exactly the new table. Rows and columns left over
+# from a longer earlier run are removed, and every remaining cell is
+# overwritten below, so no separate clear() is needed. A smaller grid also
+# keeps every later Sheets operation on this worksheet cheaper.
+
+SHEETS_BATCH_ROWS = 5000
+# Rows sent per request: 5000 rows x 10 columns stays far below the
+# Sheets API limit on cells per request.
+
+for start in range(0, len(payload), SHEETS_BATCH_ROWS):
+
+    batch = payload[start:start+SHEETS_BATCH_ROWS]
+
+    TODAY_WS.update(
+    range_name=f"A{start+1}:J{start+len(batch)}",
+    values=batch,
+    value_input_option="RAW"
+    )
 
-# Sends your DataFrame to Google Sheets.
-# .values.tolist() converts the DataFrame into a format Google Sheets understands.
+# Sends the headers and your DataFrame to Google Sheets, in one request
+# for any normal run (up to SHEETS_BATCH_ROWS rows).
+# Writing to a fixed range skips the "find the next empty row" lookup
+# that append_row/append_rows need, and RAW skips server-side parsing.
 
 # ==============================
 # GOOGLE SHEETS FORMATTING
@@ -618,15 +1064,17 @@ print("\n🔥 TOP INVESTMENT OPTIONS 🔥\n")
 
 TOP_N=min(3,len(df))
 
-for _,row in df.head(TOP_N).iterrows():
+for row in df.head(TOP_N).itertuples(index=False):
 
     print("\n------------\n")
-    print("Header:",row["header"])
-    print("Location:",row["location"])
-    print("Price:",f"{row['price_clean']:,.0f} ₸")
-    print("Size:",f"{row['sqm']:.1f} m²")
-    print("Price per m²:",f"{row['price_per_m2']:,.0f} ₸")
-    print("Link:",row["link"])
+    print("Header:",row.header)
+    print("Location:",row.location)
+    print("Price:",f"{row.price_clean:,.0f} ₸")
+    print("Size:",f"{row.sqm:.1f} m²")
+    print("Price per m²:",f"{row.price_per_m2:,.0f} ₸")
+    print("Link:",row.link)
+# itertuples yields lightweight named tuples instead of building a
+# pandas Series for every row like iterrows does.
 
 
 print("Saved to Google Sheets")
\ No newline at end of file